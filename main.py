@@ -6,18 +6,155 @@ Netease Music Enhanced Plugin for AstrBot
 """
 
 import re
+import json
 import time
+import heapq
+import itertools
 import base64
 import aiohttp
 import asyncio
-import urllib.parse
-from typing import Dict, Any, Optional, List
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable
+
+# orjson 为可选依赖，未安装时回退到标准库 json
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 from astrbot.api import star, logger
 from astrbot.api.event import AstrMessageEvent, filter
 from astrbot.core.message.message_event_result import MessageChain
 from astrbot.api.message_components import Plain, Image, Record
 
+# 单张封面超过该大小时不进入缓存
+_IMAGE_CACHE_MAX_BYTES = 512 * 1024
+
+
+# 自然语言点歌时可省略的结尾词，较长的放在前面，优先尝试完整匹配
+_TRAILING_WORDS = "的歌曲|的音乐|的歌|歌|曲"
+
+# (session_id, sender_id)
+UserKey = Tuple[str, str]
+
+
+def _fmt_duration(ms: int) -> str:
+    """Format a duration in milliseconds as m:ss."""
+    minutes, seconds = divmod(ms // 1000, 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+# --- Cache ---
+class TTLCache:
+    """
+    A small LRU cache with a per-entry TTL.
+    Expired entries are dropped lazily when accessed; once maxsize is exceeded
+    the least recently used entry is evicted. A min-heap of expiry times lets
+    expire() touch only the entries that are actually due. set() also prunes
+    due records and compacts the heap, so caches that are never swept by
+    expire() stay bounded.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        # (expire, seq, key)；seq 保证 expire 相同时无需比较 key
+        self._expiry_heap: List[Tuple[float, int, Any]] = []
+        self._seq = itertools.count()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired."""
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expire, value = item
+        if expire < time.time():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entries on overflow."""
+        now = time.time()
+        expire = now + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expire, value)
+        self._data.move_to_end(key)
+        heapq.heappush(self._expiry_heap, (expire, next(self._seq), key))
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+        self._pop_due(now)
+        # 重复写入或 LRU 淘汰会在堆中留下过时记录，超过上限时按当前数据重建
+        if len(self._expiry_heap) > 2 * self.maxsize:
+            self._expiry_heap = [(exp, next(self._seq), k) for k, (exp, _) in self._data.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        """Remove and return a value, or default if missing or expired."""
+        item = self._data.pop(key, None)
+        if item is None or item[0] < time.time():
+            return default
+        return item[1]
+
+    def expire(self) -> int:
+        """Drop all expired entries and return how many were removed."""
+        return self._pop_due(time.time())
+
+    def _pop_due(self, now: float) -> int:
+        heap = self._expiry_heap
+        removed = 0
+        while heap and heap[0][0] < now:
+            expire, _, key = heapq.heappop(heap)
+            item = self._data.get(key)
+            # 键被重新写入过时堆中记录已过时，以字典中的 expire 为准
+            if item is not None and item[0] == expire:
+                del self._data[key]
+                removed += 1
+        return removed
+
+    def next_expiry(self) -> Optional[float]:
+        """Return the earliest scheduled expiry time, or None if nothing is scheduled."""
+        return self._expiry_heap[0][0] if self._expiry_heap else None
+
+
+@dataclass(slots=True)
+class _Waiting:
+    """A pending song selection: the song_cache key and its expiry time."""
+
+    key: Tuple[UserKey, int]
+    expire: float
+
+
+@dataclass(slots=True)
+class Song:
+    """A search result flattened to the fields the plugin actually uses."""
+
+    id: int
+    name: str
+    artists: str
+    album: str
+    pic_url: str
+    dur_str: str
+
+    @classmethod
+    def from_search_result(cls, song: Dict[str, Any]) -> "Song":
+        """Project a raw /search (or /cloudsearch) song dict."""
+        album = song.get("album") or song.get("al") or {}
+        artists = song.get("artists") or song.get("ar") or ()
+        return cls(
+            id=song["id"],
+            name=song.get("name", ""),
+            artists=" / ".join([a["name"] for a in artists]),
+            album=album.get("name", "未知专辑"),
+            pic_url=album.get("picUrl", ""),
+            dur_str=_fmt_duration(song.get("duration", song.get("dt", 0))),
+        )
+
+
 # --- API Wrapper ---
 class NeteaseMusicAPI:
     """
@@ -25,56 +162,199 @@ class NeteaseMusicAPI:
     Encapsulates API calls for searching, getting details, and fetching audio URLs.
     """
 
-    def __init__(self, api_url: str, session: aiohttp.ClientSession, cookie: str = ""):
+    def __init__(self, api_url: str, session: aiohttp.ClientSession, cookie: str = "", max_concurrency: int = 8):
         self.base_url = api_url.rstrip("/")
         self.session = session
-        self.cookie = cookie
+        # 限制同时发往上游的请求数，避免群聊高峰时把自建 API 打出限流/503
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._url_prefix = f"{self.base_url}/song/url/v1"
+        # Cookie 通过请求头发送给 API，URL 中不再携带，便于上游缓存且 URL 更短
+        self._headers: Dict[str, str] = {"Cookie": cookie} if cookie else {}
+        # 歌曲详情基本不变，短期缓存
+        self._details_cache = TTLCache(maxsize=512, ttl=600)
+        # 音频地址带签名且会过期，只缓存 60 秒，远小于其有效期
+        self._audio_url_cache = TTLCache(maxsize=512, ttl=60)
+        # 群聊里同一关键词常被连续搜索，搜索结果缓存 2 分钟
+        self._search_cache = TTLCache(maxsize=512, ttl=120)
+        # 同一专辑的封面会被反复用到，封面地址内容不变，缓存 1 小时
+        self._image_cache = TTLCache(maxsize=64, ttl=3600)
+        # 正在进行中的请求，相同请求并发到达时共享同一个结果，避免重复打到上游
+        self._inflight: Dict[Any, asyncio.Task] = {}
+
+    async def _coalesce(self, key: Any, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run factory() once per key at a time; concurrent callers with the same
+        key await the same in-flight task instead of issuing their own request.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield：单个调用方被取消时不影响其他等待同一请求的调用方
+        return await asyncio.shield(task)
+
+    async def _get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """GET a JSON endpoint under the shared concurrency limit."""
+        async with self._sem, self.session.get(url, params=params, headers=self._headers) as r:
+            r.raise_for_status()
+            # 直接解析原始字节，跳过 r.json() 的 Content-Type 校验与字符集探测
+            return _json_loads(await r.read())
 
     async def search_songs(self, keyword: str, limit: int) -> List[Dict[str, Any]]:
-        """Search for songs by keyword."""
-        url = f"{self.base_url}/search?keywords={urllib.parse.quote(keyword)}&limit={limit}&type=1"
-        async with self.session.get(url) as r:
-            r.raise_for_status()
-            data = await r.json()
-            return data.get("result", {}).get("songs", [])
+        """Search for songs by keyword. Non-empty results are cached for a short time."""
+        cache_key = (keyword, limit)
+        cached = self._search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        return await self._coalesce(("search", keyword, limit), lambda: self._fetch_search(keyword, limit))
+
+    async def _fetch_search(self, keyword: str, limit: int) -> List[Dict[str, Any]]:
+        # 查询参数交给 aiohttp/yarl 编码
+        params = {"keywords": keyword, "limit": limit, "type": 1}
+        data = await self._get_json(f"{self.base_url}/search", params)
+        songs = data.get("result", {}).get("songs", [])
+        if songs:
+            self._search_cache.set((keyword, limit), songs)
+        return songs
 
     async def get_song_details(self, song_id: int) -> Optional[Dict[str, Any]]:
-        """Get detailed information for a single song."""
-        url = f"{self.base_url}/song/detail?ids={str(song_id)}"
-        async with self.session.get(url) as r:
-            r.raise_for_status()
-            data = await r.json()
-            songs = data.get("songs", [])
-            return songs[0] if songs else None  # 安全检查，避免 IndexError
+        """Get detailed information for a single song. Results are cached for a short time."""
+        cached = self._details_cache.get(song_id)
+        if cached is not None:
+            return cached
+        return await self._coalesce(("detail", song_id), lambda: self._fetch_song_details(song_id))
+
+    async def _fetch_song_details(self, song_id: int) -> Optional[Dict[str, Any]]:
+        data = await self._get_json(f"{self.base_url}/song/detail", {"ids": song_id})
+        songs = data.get("songs", [])
+        if not songs:  # 安全检查，避免 IndexError
+            return None
+        self._details_cache.set(song_id, songs[0])
+        return songs[0]
+
+    async def _probe_audio_url(self, song_id: int, quality: str) -> Optional[str]:
+        """Request the audio URL for a single quality level."""
+        params = {"id": song_id, "level": quality}
+        data = await self._get_json(self._url_prefix, params)
+        # 修复：先检查列表是否为空，避免 IndexError
+        data_list = data.get("data", [])
+        if data_list:  # 确保列表不为空
+            return data_list[0].get("url") or None
+        return None
 
     async def get_audio_url(self, song_id: int, quality: str) -> Optional[str]:
         """
         Get the audio stream URL for a song with automatic quality fallback.
+        Concurrent lookups for the same song share one request chain, and
+        found URLs are cached briefly.
+        """
+        cache_key = (song_id, quality)
+        cached = self._audio_url_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        return await self._coalesce(("url", song_id, quality), lambda: self._fetch_audio_url(song_id, quality))
+
+    async def _fetch_audio_url(self, song_id: int, quality: str) -> Optional[str]:
+        """
+        All qualities are probed concurrently; results are taken in preference
+        order, so the call returns as soon as the best available quality is
+        known and the remaining probes are cancelled.
         """
         qualities_to_try = list(dict.fromkeys([quality, "exhigh", "higher", "standard"]))
-        for q in qualities_to_try:
-            encoded_cookie = urllib.parse.quote(self.cookie)
-            url = f"{self.base_url}/song/url/v1?id={str(song_id)}&level={q}&cookie={encoded_cookie}"
-
-            async with self.session.get(url) as r:
-                r.raise_for_status()
-                data = await r.json()
-                # 修复：先检查列表是否为空，避免 IndexError
-                data_list = data.get("data", [])
-                if data_list:  # 确保列表不为空
-                    audio_info = data_list[0]
-                    if audio_info.get("url"):
-                        return audio_info["url"]
+        tasks = [asyncio.create_task(self._probe_audio_url(song_id, q)) for q in qualities_to_try]
+        last_error: Optional[BaseException] = None
+        any_succeeded = False
+
+        try:
+            # 按音质优先级依次等待，高音质可用时无需等待低音质的结果
+            for task in tasks:
+                try:
+                    url = await task
+                except Exception as e:
+                    last_error = e
+                    continue
+                any_succeeded = True
+                if url:
+                    self._audio_url_cache.set((song_id, quality), url)
+                    return url
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # 取走未等待任务的异常，避免 "Task exception was never retrieved" 警告
+                    task.exception()
+
+        # 所有请求都出错时（而非单纯无可用音质），向上抛出以便调用方提示错误
+        if not any_succeeded and last_error is not None:
+            raise last_error
         return None
 
-    async def download_image(self, url: str) -> Optional[bytes]:
-        """Download image data from a URL."""
+    async def get_song_play_bundle(self, song_id: int, quality: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Get song details and the audio URL in one upstream round-trip via the
+        API's /batch endpoint. Falls back to concurrent separate requests if the
+        batch call fails, and to the quality fallback chain if the preferred
+        quality has no URL.
+        """
+        cached = self._details_cache.get(song_id)
+        if cached is not None:
+            # 详情已缓存，只需请求音频地址
+            return cached, await self.get_audio_url(song_id, quality)
+
+        # /batch 的参数名为网易云内部接口路径，参数值为对应接口的 JSON 参数
+        params = {
+            "/api/v3/song/detail": json.dumps({"c": json.dumps([{"id": song_id}])}),
+            "/api/song/enhance/player/url/v1": json.dumps(
+                {"ids": json.dumps([song_id]), "level": quality, "encodeType": "flac"}
+            ),
+        }
+
+        data: Any = None
+        try:
+            data = await self._get_json(f"{self.base_url}/batch", params)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            # 连接错误、超时或返回非 JSON 时都回退为普通请求
+            logger.warning(f"Netease Music plugin: Batch request failed, falling back to separate requests. Error: {e!s}")
+        if not isinstance(data, dict):
+            data = {}
+
+        songs = data.get("/api/v3/song/detail", {}).get("songs", [])
+        if not songs:
+            details, audio_url = await asyncio.gather(
+                self.get_song_details(song_id), self.get_audio_url(song_id, quality)
+            )
+            return details, audio_url
+        details = songs[0]
+        self._details_cache.set(song_id, details)
+
+        url_list = data.get("/api/song/enhance/player/url/v1", {}).get("data", [])
+        audio_url = url_list[0].get("url") if url_list else None
+        if not audio_url:
+            # 首选音质不可用，走正常的音质回退流程
+            audio_url = await self.get_audio_url(song_id, quality)
+        return details, audio_url
+
+    async def download_image(self, url: str) -> Optional[str]:
+        """Download an image from a URL and return it base64-encoded. Small images are cached by URL."""
         if not url:
             return None
-        async with self.session.get(url) as r:
-            if r.status == 200:
-                return await r.read()
-        return None
+        cached = self._image_cache.get(url)
+        if cached is not None:
+            return cached
+
+        async with self._sem, self.session.get(url) as r:
+            if r.status != 200:
+                return None
+            data = await r.read()
+
+        # 直接编码为 ASCII 字符串，不再额外保留一份原始 bytes
+        encoded = base64.b64encode(data).decode("ascii")
+        # 过大的图片不缓存，避免占用过多内存
+        if len(data) <= _IMAGE_CACHE_MAX_BYTES:
+            self._image_cache.set(url, encoded)
+        return encoded
 
 
 # --- Main Plugin Class ---
@@ -89,6 +369,14 @@ class Main(star.Star):
         self.config.setdefault("api_url", "http://127.0.0.1:3000")
         self.config.setdefault("quality", "exhigh")
         self.config.setdefault("search_limit", 5)
+        # 热路径上频繁读取的配置项，缓存为实例属性
+        self._quality: str = self.config["quality"]
+        self._search_limit = int(self.config["search_limit"])
+        self.config.setdefault("cache_ttl", 60)
+        self.config.setdefault("cache_maxsize", 1024)
+        self.config.setdefault("combine_messages", False)
+        self.config.setdefault("batch_endpoint", False)
+        self.config.setdefault("cover_as_url", False)
 
         # 修复：添加警告提示默认配置
         if self.config["api_url"] == "http://127.0.0.1:3000":
@@ -121,9 +409,24 @@ class Main(star.Star):
         # 构建动态正则表达式
         self.regex_pattern = self._build_regex_pattern()
         self.regex_compiled = re.compile(self.regex_pattern, re.IGNORECASE)
+        self._cmd_prefixed_re, self._cmd_bare_re = self._build_cmd_strip_patterns()
 
-        self.waiting_users: Dict[str, Dict[str, Any]] = {}
-        self.song_cache: Dict[str, List[Dict[str, Any]]] = {}
+        # 触发词快速预检：绝大多数普通聊天消息用一次 startswith 即可排除，无需进入正则
+        # 正则带 IGNORECASE，这里统一转小写比较
+        triggers = self.config.get("regex_triggers", [])
+        self._trigger_tuple = tuple(t.lower() for t in triggers)
+        self._trigger_maxlen = max((len(t) for t in triggers), default=0)
+
+        # 有上限的 LRU + TTL 缓存，过期项在访问时惰性清除
+        # waiting_users 多保留一段宽限期，以便过期后回复数字的用户仍能收到"已过期"提示
+        cache_ttl = self.config["cache_ttl"]
+        cache_maxsize = self.config["cache_maxsize"]
+        self.waiting_users = TTLCache(maxsize=cache_maxsize, ttl=cache_ttl + 60)
+        self.song_cache = TTLCache(maxsize=cache_maxsize, ttl=cache_ttl)
+        # song_cache 的键为 (user_key, 序号)，同一秒内多次搜索也不会互相覆盖
+        self._cache_counter = itertools.count(1)
+        # 缓存为空时清理任务在此等待，有新条目写入时再唤醒
+        self._cleanup_wakeup = asyncio.Event()
 
         # 占位符
         self.http_session: Optional[aiohttp.ClientSession] = None
@@ -153,13 +456,30 @@ class Main(star.Star):
         # 触发词必须在句首（在负向前瞻断言之后）
         # 匹配：非指令前缀开头 + 触发词 + 任意内容 + 可选的结尾词
         if prefixes_part:
-            pattern = rf"^(?![{prefixes_part}])(?:{triggers_part})\s*(.+?)(?:的歌|的歌曲|的音乐|歌|曲)?$"
+            pattern = rf"^(?![{prefixes_part}])(?:{triggers_part})\s*(.+?)(?:{_TRAILING_WORDS})?$"
         else:
             # 如果没有配置前缀，则不使用负向前瞻断言
-            pattern = rf"^(?:{triggers_part})\s*(.+?)(?:的歌|的歌曲|的音乐|歌|曲)?$"
+            pattern = rf"^(?:{triggers_part})\s*(.+?)(?:{_TRAILING_WORDS})?$"
 
         return pattern
 
+    def _build_cmd_strip_patterns(self) -> Tuple[Optional[re.Pattern], re.Pattern]:
+        """预编译用于从指令消息中剥离指令名的正则（带前缀 / 不带前缀各一个）"""
+        command_names = ["点歌", *self.config.get("command_aliases", [])]
+        prefixes = self.config.get("command_prefixes", ["/", "!", "?", ".", "。"])
+
+        names_part = "|".join(re.escape(cmd) for cmd in command_names)
+
+        if prefixes:
+            prefixes_part = "|".join(re.escape(p) for p in prefixes)
+            prefixed = re.compile(rf"^(?:{prefixes_part})\s*(?:{names_part})(?:@\S+)?\s*(.*)$", re.IGNORECASE)
+        else:
+            prefixed = None
+
+        # @filter.command 装饰器可能已经剥离了前缀，因此也需要匹配不带前缀的指令
+        bare = re.compile(rf"^(?:{names_part})(?:@\S+)?\s+(.+)$", re.IGNORECASE)
+        return prefixed, bare
+
     # --- Lifecycle Hooks ---
 
     async def initialize(self):
@@ -170,10 +490,30 @@ class Main(star.Star):
         csrf = self.config.get("csrf_token", "").strip()
         music_r_u = self.config.get("music_r_u", "").strip()
 
-        # 构造完整的 Cookie 字符串
-        full_cookie = f"MUSIC_U={music_u}; __csrf={csrf}; MUSIC_R_U={music_r_u};"
-
-        self.http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=20))
+        # 构造完整的 Cookie 字符串，只包含已填写的字段；全部为空时不携带 Cookie
+        cookie_parts = []
+        if music_u:
+            cookie_parts.append(f"MUSIC_U={music_u}")
+        if csrf:
+            cookie_parts.append(f"__csrf={csrf}")
+        if music_r_u:
+            cookie_parts.append(f"MUSIC_R_U={music_r_u}")
+        full_cookie = "; ".join(cookie_parts)
+
+        # 复用长连接并缓存 DNS，避免每次请求都重新握手；connect/sock_read 分开设置，防止挂起的连接被 total 掩盖
+        connector = aiohttp.TCPConnector(
+            limit=50,
+            limit_per_host=20,
+            ttl_dns_cache=300,
+            keepalive_timeout=75,
+            enable_cleanup_closed=True,
+        )
+        # Cookie 由插件显式传递，不保存响应中的 Set-Cookie，避免不同请求之间互相串扰
+        self.http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=20, connect=3, sock_read=15),
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
 
         # 将拼接好的 full_cookie 传给 API
         self.api = NeteaseMusicAPI(self.config["api_url"], self.http_session, full_cookie)
@@ -198,37 +538,35 @@ class Main(star.Star):
         # 修复：调用父类的 terminate 方法
         await super().terminate()
 
-    def _get_user_key(self, event: AstrMessageEvent) -> str:
+    def _get_user_key(self, event: AstrMessageEvent) -> UserKey:
         """
         生成用户唯一标识，结合会话和发送者ID
         确保不同用户的搜索会话互不干扰
+        使用元组而非拼接字符串，无需格式化，哈希与比较均在 C 层完成
         """
-        session_id = event.get_session_id()
-        sender_id = event.get_sender_id()  # 使用官方方法，符合 Law of Demeter
-        return f"{session_id}_{sender_id}"
+        # 使用官方方法，符合 Law of Demeter
+        return event.get_session_id(), event.get_sender_id()
 
     async def _periodic_cleanup(self):
         """
-        A background task that runs periodically to clean up expired sessions.
+        A background task that sweeps expired cache entries.
+        Expiry is already enforced lazily on access; this only reclaims memory
+        held by entries that are never looked up again. It sleeps until the
+        next scheduled expiry, or until new entries are added when idle.
         """
         while True:
             try:
-                await asyncio.sleep(60)
-                now = time.time()
-                expired_sessions = []
-
-                # 修复：使用 user_key 进行清理
-                for user_key, user_session in self.waiting_users.items():
-                    if user_session['expire'] < now:
-                        expired_sessions.append((user_key, user_session['key']))
-
-                if expired_sessions:
-                    logger.info(f"Netease Music plugin: Cleaning up {len(expired_sessions)} expired session(s).")
-                    for user_key, cache_key in expired_sessions:
-                        if user_key in self.waiting_users:
-                            del self.waiting_users[user_key]
-                        if cache_key in self.song_cache:
-                            del self.song_cache[cache_key]
+                deadlines = [t for t in (self.waiting_users.next_expiry(), self.song_cache.next_expiry()) if t]
+                if deadlines:
+                    # 至少间隔 1 秒，避免忙等
+                    await asyncio.sleep(max(1.0, min(deadlines) - time.time()))
+                else:
+                    self._cleanup_wakeup.clear()
+                    await self._cleanup_wakeup.wait()
+
+                removed = self.waiting_users.expire() + self.song_cache.expire()
+                if removed:
+                    logger.info(f"Netease Music plugin: Cleaned up {removed} expired cache entries.")
 
             except Exception as e:
                 logger.error(f"Netease Music plugin: Cleanup task error: {e!s}")
@@ -244,40 +582,18 @@ class Main(star.Star):
         # 从完整消息中提取关键词（去掉指令前缀）
         message_str = event.message_str.strip()
 
-        # 移除指令（点歌、/点歌、!music 等）
-        # 获取所有可能的指令名称
-        command_names = ["点歌"]
-        command_aliases = self.config.get("command_aliases", [])
-        command_names.extend(command_aliases)
-        
-        # 获取所有配置的前缀
-        command_prefixes = self.config.get("command_prefixes", ["/", "!", "?", ".", "。"])
-
+        # 移除指令（点歌、/点歌、!music 等），正则已在 __init__ 中预编译
         keyword = message_str
-        matched = False
-        
+
         # 1. 首先尝试匹配带前缀的指令（/点歌、!music 等）
-        for prefix in command_prefixes:
-            for cmd in command_names:
-                escaped_prefix = re.escape(prefix)
-                pattern = rf"^{escaped_prefix}\s*{re.escape(cmd)}(?:@\S+)?\s*(.*)$"
-                match = re.match(pattern, message_str, re.IGNORECASE)
-                if match:
-                    keyword = match.group(1).strip()
-                    matched = True
-                    break
-            if matched:
-                break
-        
+        match = self._cmd_prefixed_re.match(message_str) if self._cmd_prefixed_re else None
+
         # 2. 如果没匹配到，尝试匹配不带前缀的指令（点歌、music 等）
-        # 这是因为 @filter.command 装饰器可能已经剥离了前缀
-        if not matched:
-            for cmd in command_names:
-                pattern = rf"^{re.escape(cmd)}(?:@\S+)?\s+(.+)$"
-                match = re.match(pattern, message_str, re.IGNORECASE)
-                if match:
-                    keyword = match.group(1).strip()
-                    break
+        if not match:
+            match = self._cmd_bare_re.match(message_str)
+
+        if match:
+            keyword = match.group(1).strip()
 
         if not keyword:
             await event.send(MessageChain([Plain(self.config["msg_no_keyword"])]))
@@ -288,8 +604,12 @@ class Main(star.Star):
     @filter.regex(".*")
     async def natural_language_handler(self, event: AstrMessageEvent):
         """Handles song requests in natural language."""
+        msg = event.message_str
+        if not msg or not msg[:self._trigger_maxlen].lower().startswith(self._trigger_tuple):
+            return
+
         # 使用动态构建的正则表达式
-        match = self.regex_compiled.match(event.message_str)
+        match = self.regex_compiled.match(msg)
         if match:
             keyword = match.group(1).strip()
             if keyword:
@@ -302,34 +622,31 @@ class Main(star.Star):
         # 修复：使用用户唯一Key，解决会话隔离问题
         user_key = self._get_user_key(event)
 
-        if user_key not in self.waiting_users:
+        user_session = self.waiting_users.get(user_key)
+        if user_session is None:
             return
+        cache_key, expire = user_session.key, user_session.expire
 
-        user_session = self.waiting_users[user_key]
-        if time.time() > user_session["expire"]:
+        if time.time() > expire:
             # 缓存过期，发送提示消息
             await event.send(MessageChain([Plain(self.config["msg_cache_expired"])]))
-            if user_key in self.waiting_users:
-                del self.waiting_users[user_key]
-            cache_key = user_session.get("key")
-            if cache_key and cache_key in self.song_cache:
-                del self.song_cache[cache_key]
+            self.waiting_users.pop(user_key)
+            self.song_cache.pop(cache_key)
             return
 
-        try:
-            num = int(event.message_str.strip())
-        except ValueError:
+        # isdecimal 与 int() 接受的字符一致（isdigit 会放过 "²" 之类的字符），无需 try/except
+        text = event.message_str.strip()
+        if not text.isdecimal():
             return
+        num = int(text)
 
         # Obtain the actual length of the cached song list and perform precise boundary checks.
-        cache_key = user_session["key"]
         songs = self.song_cache.get(cache_key)
 
         # Cache lost: no response and return
         if not songs:
             await event.send(MessageChain([Plain(self.config["msg_cache_expired"])]))
-            if user_key in self.waiting_users:
-                del self.waiting_users[user_key]
+            self.waiting_users.pop(user_key)
             return
 
         # Major fix: use len(songs) but not limit
@@ -339,11 +656,10 @@ class Main(star.Star):
             return
 
         event.stop_event()
-        await self.play_selected_song(event, cache_key, num)
-
         # only remove waiting when used play_selected_songs.
-        if user_key in self.waiting_users:
-            del self.waiting_users[user_key]
+        # 在播放（需要等待网络请求）之前移除，避免用户重复发送数字时再次进入选择流程
+        self.waiting_users.pop(user_key)
+        await self.play_selected_song(event, cache_key, num)
 
     # --- Core Logic ---
 
@@ -359,7 +675,7 @@ class Main(star.Star):
             await event.send(MessageChain([Plain(self.config["msg_searching"])]))
 
         try:
-            songs = await self.api.search_songs(keyword, self.config["search_limit"])
+            songs = await self.api.search_songs(keyword, self._search_limit)
         except Exception as e:
             logger.error(f"Netease Music plugin: API search failed. Error: {e!s}")
             await event.send(MessageChain([Plain(self.config["msg_api_error"])]))
@@ -373,29 +689,25 @@ class Main(star.Star):
         user_key = self._get_user_key(event)
 
         # 清理该用户的旧缓存，避免内存泄漏
-        if user_key in self.waiting_users:
-            old_cache_key = self.waiting_users[user_key].get("key")
-            if old_cache_key and old_cache_key in self.song_cache:
-                del self.song_cache[old_cache_key]
+        old_session = self.waiting_users.get(user_key)
+        if old_session:
+            self.song_cache.pop(old_session.key)
 
-        cache_key = f"{user_key}_{int(time.time())}"
-        self.song_cache[cache_key] = songs
+        # 搜索结果只投影一次为 Song，后续展示与播放不再反复解析嵌套字典
+        songs = [Song.from_search_result(song) for song in songs]
+        cache_key = (user_key, next(self._cache_counter))
+        self.song_cache.set(cache_key, songs)
 
         # 使用可配置的搜索结果标题
         results_title = self.config["msg_search_results"].format(count=len(songs))
-        response_lines = [results_title]
-        for i, song in enumerate(songs, 1):
-            artists = " / ".join(a["name"] for a in song.get("artists", []))
-            album = song.get("album", {}).get("name", "未知专辑")
-            duration_ms = song.get("duration", 0)
-            dur_str = f"{duration_ms // 60000}:{(duration_ms % 60000) // 1000:02d}"
-            response_lines.append(f"{i}. {song['name']} - {artists} 《{album}》 [{dur_str}]")
+        song_lines = "\n".join([f"{i}. {s.name} - {s.artists} 《{s.album}》 [{s.dur_str}]" for i, s in enumerate(songs, 1)])
 
-        await event.send(MessageChain([Plain("\n".join(response_lines))]))
+        await event.send(MessageChain([Plain(f"{results_title}\n{song_lines}")]))
 
-        self.waiting_users[user_key] = {"key": cache_key, "expire": time.time() + 60}
+        self.waiting_users.set(user_key, _Waiting(cache_key, time.time() + self.config["cache_ttl"]))
+        self._cleanup_wakeup.set()
 
-    async def play_selected_song(self, event: AstrMessageEvent, cache_key: str, num: int):
+    async def play_selected_song(self, event: AstrMessageEvent, cache_key: Tuple[UserKey, int], num: int):
         """Plays the song selected by the user."""
         songs = self.song_cache.get(cache_key)
 
@@ -411,36 +723,84 @@ class Main(star.Star):
 
         # Confirm song
         selected_song = songs[num - 1]
-        song_id = selected_song["id"]
+        song_id = selected_song.id
+
+        self.song_cache.pop(cache_key)
 
-        if cache_key in self.song_cache:
-            del self.song_cache[cache_key]
+        quality = self._quality
+        cover_as_url = self.config["cover_as_url"]
+        audio_task: Optional[asyncio.Task] = None
+        image_task: Optional[asyncio.Task] = None
+        cover: Optional[Image] = None
+        pending: List[asyncio.Task] = []
+
+        # 搜索结果中已带封面地址时（如 cloudsearch 接口），不必等待详情，立即开始下载封面
+        speculative_cover = selected_song.pic_url
+        if speculative_cover and not cover_as_url:
+            image_task = asyncio.create_task(self.api.download_image(speculative_cover))
+            pending.append(image_task)
 
         try:
-            song_details = await self.api.get_song_details(song_id)
+            if self.config["batch_endpoint"]:
+                # 通过 /batch 一次请求同时获取详情与音频地址
+                song_details, audio_url = await self.api.get_song_play_bundle(song_id, quality)
+            else:
+                # 详情与音频地址互不依赖，并发请求
+                details_task = asyncio.create_task(self.api.get_song_details(song_id))
+                audio_task = asyncio.create_task(self.api.get_audio_url(song_id, quality))
+                pending += [details_task, audio_task]
+                song_details = await details_task
+
             if not song_details:
                 raise ValueError("无法获取歌曲详细信息。")
 
-            audio_url = await self.api.get_audio_url(song_id, self.config["quality"])
+            cover_url = song_details.get("al", {}).get("picUrl", "")
+            if cover_as_url:
+                # 直接把封面地址交给平台拉取，插件无需下载和编码
+                if cover_url:
+                    cover = Image.fromURL(cover_url)
+            elif image_task is None:
+                # 否则拿到 picUrl 后立即开始下载封面，与音频地址请求重叠
+                image_task = asyncio.create_task(self.api.download_image(cover_url))
+                pending.append(image_task)
+
+            if audio_task is not None:
+                audio_url = await audio_task
             if not audio_url:
                 await event.send(MessageChain([Plain(self.config["msg_no_audio_url"])]))
                 return
 
+            if image_task is not None:
+                try:
+                    image_b64 = await image_task
+                    if image_b64:
+                        cover = Image.fromBase64(image_b64)
+                except Exception as e:
+                    # 封面下载失败不影响播放
+                    logger.warning(f"Netease Music plugin: Failed to download cover for song {song_id}. Error: {e!s}")
+
             title = song_details.get("name", "")
             artists = " / ".join(a["name"] for a in song_details.get("ar", []))
             album = song_details.get("al", {}).get("name", "未知专辑")
-            cover_url = song_details.get("al", {}).get("picUrl", "")
-            duration_ms = song_details.get("dt", 0)
-            dur_str = f"{duration_ms // 60000}:{(duration_ms % 60000) // 1000:02d}"
+            dur_str = _fmt_duration(song_details.get("dt", 0))
 
-            await self._send_song_messages(event, num, title, artists, album, dur_str, cover_url, audio_url)
+            await self._send_song_messages(event, num, title, artists, album, dur_str, cover, audio_url)
 
         except Exception as e:
             logger.error(f"Netease Music plugin: Failed to play song {song_id}. Error: {e!s}")
             await event.send(MessageChain([Plain(self.config["msg_play_error"])]))
 
+        finally:
+            # 提前返回或出错时，取消仍在进行的请求
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # 取走未等待任务的异常，避免 "Task exception was never retrieved" 警告
+                    task.exception()
+
     async def _send_song_messages(self, event: AstrMessageEvent, num: int, title: str, artists: str, album: str,
-                                  dur_str: str, cover_url: str, audio_url: str):
+                                  dur_str: str, cover: Optional[Image], audio_url: str):
         """Constructs and sends the song info and audio messages."""
         # 使用可配置的歌曲详情模板
         detail_text = self.config["msg_song_detail"].format(
@@ -449,15 +809,18 @@ class Main(star.Star):
             artists=artists,
             album=album,
             duration=dur_str,
-            quality=self.config['quality']
+            quality=self._quality
         )
         info_components = [Plain(detail_text)]
 
-        # add None check
-        if self.api:
-            image_data = await self.api.download_image(cover_url)
-            if image_data:
-                info_components.append(Image.fromBase64(base64.b64encode(image_data).decode()))
+        if cover:
+            info_components.append(cover)
+
+        # 适配器支持图文与语音混合时合并为一条消息发送，省去一次往返
+        if self.config["combine_messages"]:
+            info_components.append(Record(file=audio_url))
+            await event.send(MessageChain(info_components))
+            return
 
         await event.send(MessageChain(info_components))
         await event.send(MessageChain([Record(file=audio_url)]))